@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from tqdm import tqdm
+from time import perf_counter
+from itertools import islice
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+from tempfile import TemporaryDirectory
+from sklearn.exceptions import UndefinedMetricWarning
+from .utils import (
+    ArgparseFormatter,
+    TUNED_CONFIG,
+    dir_path,
+    file_path,
+    get_formatted_logger,
+)
+from .classifier import Classifier
+from .evaluate import get_checkpointed_report
+from .train import BYTE_TOKENS, get_ngram_stats, iter_data_from_directory
+import argparse
+import warnings
+import typing
+import json
+import os
+
+
+def get_trial_seconds(trial: Callable[[], Any], repeats: int) -> Tuple[float, float]:
+    """
+    Time the fastest of repeated trials after an unmeasured warm-up, together
+    with the spread between repetitions
+    """
+    trial()
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        trial()
+        timings.append(perf_counter() - start)
+    return min(timings), max(timings) - min(timings)
+
+
+def get_best_knobs(
+    timings: Dict[Tuple, Tuple[float, float]], knob_names: List[str], default: Tuple
+) -> Tuple[dict, dict]:
+    """
+    Pick fastest knob combination and summarize it against the default, which
+    is kept unless it is slower by more than the spread of either trial
+    """
+    best = min(timings, key=lambda knobs: timings[knobs][0])
+    noise = max(timings[default][1], timings[best][1])
+    if timings[default][0] - timings[best][0] <= noise:
+        best = default
+    summary = {
+        "trials": [
+            dict(zip(knob_names, knobs), seconds=seconds, spread=spread)
+            for knobs, (seconds, spread) in timings.items()
+        ],
+        "default": dict(zip(knob_names, default)),
+        "best": dict(zip(knob_names, best)),
+        "speedup": timings[default][0] / timings[best][0],
+    }
+    return dict(zip(knob_names, best)), summary
+
+
+def tune_backend(
+    classifiers: Dict[str, Classifier], docs: List[str], repeats: int
+) -> dict:
+    """
+    Compare scoring backends of the prediction path, which is only reported
+    since the fastest backend depends on the model rather than the host
+    """
+    timings = {}
+    for backend in tqdm(classifiers):
+        timings[(backend,)] = get_trial_seconds(
+            lambda: list(classifiers[backend].predict_iter(docs)), repeats
+        )
+    return get_best_knobs(timings, ["backend"], ("auto",))[1]
+
+
+def tune_prediction(
+    classifier: Classifier, docs: List[str], batch_sizes: List[int], repeats: int
+) -> Tuple[dict, dict]:
+    """Tune batch size of the prediction path"""
+    timings = {}
+    batch_sizes = sorted(set(batch_sizes) | {64})
+    for batch_size in tqdm(batch_sizes):
+        timings[(batch_size,)] = get_trial_seconds(
+            lambda: list(classifier.predict_iter(docs, batch_size)), repeats
+        )
+    return get_best_knobs(timings, ["batch_size"], (64,))
+
+
+def tune_evaluation(
+    classifier: Classifier, docs: List[str], chunk_sizes: List[int], repeats: int
+) -> Tuple[dict, dict]:
+    """Tune chunk size of checkpointed evaluation"""
+    timings = {}
+    chunk_sizes = sorted(set(chunk_sizes) | {1000})
+    with TemporaryDirectory() as directory:
+        for chunk_size in tqdm(chunk_sizes):
+            results_path = os.path.join(directory, "results_%s.tsv" % chunk_size)
+
+            # start every repetition from scratch
+            def trial() -> None:
+                for path in (results_path, "%s.checkpoint" % results_path):
+                    if os.path.isfile(path):
+                        os.remove(path)
+                # placeholder labels only affect the discarded report
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UndefinedMetricWarning)
+                    get_checkpointed_report(
+                        ((doc, "") for doc in docs),
+                        classifier,
+                        results_path,
+                        chunk_size,
+                    )
+
+            timings[(chunk_size,)] = get_trial_seconds(trial, repeats)
+    return get_best_knobs(timings, ["chunk_size"], (1000,))
+
+
+def tune_ingestion(
+    train_directory: str,
+    config: dict,
+    sample_size: int,
+    io_workers: List[int],
+    repeats: int,
+) -> Tuple[dict, dict]:
+    """Tune reader threads overlapping corpus-tree ingestion with counting"""
+    timings = {}
+    io_workers = sorted(set(io_workers) | {8})
+    for workers in tqdm(io_workers):
+        # count n-grams over a sample of the corpus tree
+        def trial() -> None:
+            counter: typing.Counter = Counter()
+            for doc, _ in islice(
+                iter_data_from_directory(
+                    train_directory,
+                    workers,
+                    binary=config["ngram_token"] in BYTE_TOKENS,
+                ),
+                sample_size,
+            ):
+                counter.update(
+                    get_ngram_stats(
+                        doc,
+                        config["ngrams_start"],
+                        config["ngrams_end"],
+                        config["ngram_method"],
+                        config["ngram_token"],
+                    )
+                )
+
+        timings[(workers,)] = get_trial_seconds(trial, repeats)
+    return get_best_knobs(timings, ["io_workers"], (8,))
+
+
+def main(args: argparse.Namespace) -> None:
+    """Main workflow to tune throughput knobs for this host"""
+    # read in sample data to memory
+    LOGGER.info("Reading sample data")
+    with open(args.sample_data, "r") as input_file_stream:
+        docs = [line.strip() for line in islice(input_file_stream, args.sample_size)]
+
+    # read model into memory
+    LOGGER.info("Reading model: %s" % args.model)
+    with open(args.model, "r") as input_file_stream:
+        model = json.load(input_file_stream)
+
+    # prepare one classifier per scoring backend, skipping dense storage
+    # beyond the memory budget
+    classifier = Classifier(model)
+    LOGGER.info("Default backend resolves to %s" % classifier.backend)
+    classifiers = {"auto": classifier}
+    dense_bytes = len(classifier.vocabulary) * len(classifier.labels) * 8
+    for backend in ["dense", "sparse"]:
+        if backend == classifier.backend:
+            classifiers[backend] = classifier
+        elif backend == "dense" and dense_bytes > args.max_dense_bytes:
+            LOGGER.info("Skipping dense backend of %.1f MB" % (dense_bytes / 2**20))
+        else:
+            classifiers[backend] = Classifier(model, backend=backend)
+
+    # run timed trials for all workflows
+    tuned: Dict[str, dict] = {}
+    report: Dict[str, dict] = {}
+    LOGGER.info("Comparing scoring backends")
+    report["backend"] = dict(
+        tune_backend(classifiers, docs, args.repeats), model=args.model
+    )
+    LOGGER.info("Tuning prediction")
+    tuned["predict"], report["predict"] = tune_prediction(
+        classifier, docs, args.batch_sizes, args.repeats
+    )
+    LOGGER.info("Tuning evaluation")
+    tuned["evaluate"], report["evaluate"] = tune_evaluation(
+        classifier, docs, args.chunk_sizes, args.repeats
+    )
+    if args.train_directory:
+        LOGGER.info("Tuning corpus-tree ingestion")
+        tuned["train"], report["ingestion"] = tune_ingestion(
+            args.train_directory,
+            model["config"],
+            args.sample_size,
+            args.io_workers,
+            args.repeats,
+        )
+        tuned["evaluate"]["io_workers"] = tuned["train"]["io_workers"]
+
+    # report speedups over defaults, where backends are specific to the model
+    for workflow, summary in report.items():
+        LOGGER.info(
+            "%s: %s (%.2fx speedup over %s)"
+            % (workflow, summary["best"], summary["speedup"], summary["default"])
+        )
+    LOGGER.info(
+        "Backends are not persisted, pass --backend %s for this model instead"
+        % report["backend"]["best"]["backend"]
+    )
+
+    # dump tuned config picked up by other workflows
+    LOGGER.info("Dumping tuned config: %s" % args.output)
+    with open(args.output, "w") as output_file_stream:
+        json.dump(dict(tuned, report=report), output_file_stream, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=ArgparseFormatter)
+    parser.add_argument(
+        "--model",
+        type=file_path,
+        default="./models/model_3_300.json",
+        help="Path to model JSON file",
+    )
+    parser.add_argument(
+        "--sample-data",
+        type=file_path,
+        default="./data/wili-2018/x_test.txt",
+        help="Path to data sampled for trials, one document per line",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=500,
+        help="Number of documents per trial",
+    )
+    parser.add_argument(
+        "--train-directory",
+        type=dir_path,
+        help="Path to corpus tree with one sub-directory per category, "
+        "used to tune ingestion if provided",
+    )
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 16, 64, 256],
+        help="Prediction batch sizes to try besides the default",
+    )
+    parser.add_argument(
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Checkpointed evaluation chunk sizes to try besides the default",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16],
+        help="Corpus-tree reader thread counts to try besides the default",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Number of repetitions per trial after a warm-up, keeping the "
+        "fastest and requiring speedups beyond their spread",
+    )
+    parser.add_argument(
+        "--max-dense-bytes",
+        type=int,
+        default=2**30,
+        help="Skip dense backend trial if its profiles exceed this many bytes",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=TUNED_CONFIG,
+        help="Path to dump tuned config picked up by other workflows",
+    )
+    parser.add_argument(
+        "--logging-level",
+        help="Set logging level",
+        choices=["debug", "info", "warning", "error", "critical"],
+        default="info",
+        type=str,
+    )
+    LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
+    args = parser.parse_args()
+    if args.repeats < 2:
+        parser.error("argument --repeats: at least 2 repetitions measure spread")
+    main(args)
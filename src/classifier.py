@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+from collections import Counter
+from .train import BYTE_TOKENS, get_ngram_stats
+from scipy.sparse import csr_matrix
+import numpy as np
+import typing
+import json
+import re
+import sys
+
+UNKNOWN = "Unknown"
+WORD_LOCAL_TOKENS = ("char", "char_wb", "byte_wb")
+BRACKETS = re.compile(r"[\[\]]")
+Document = typing.Union[str, bytes]
+DENSITY_THRESHOLD = 0.25
+
+
+class Classifier:
+    """
+    Importable category detector which loads a model once and, by default,
+    scores documents with the same semantics as `evaluate.get_diff_norms`
+
+    Profiles are stored over a shared vocabulary either as dense arrays or,
+    for sparsely populated models such as large-cutoff word n-grams, as a
+    CSR matrix; `backend="auto"` picks based on profile density
+
+    Models trained with a category hierarchy can be scored coarse-to-fine
+    with `beam_width > 0`, comparing documents against merged group profiles
+    first and then only against categories of the top-scoring groups, for
+    which categories are reordered group by group in `labels`
+
+    Instances are read-only after construction and can therefore be shared
+    freely across threads
+    """
+
+    def __init__(
+        self,
+        model: dict,
+        metric: str = "euclidean",
+        normalization: str = "support",
+        backend: str = "auto",
+        beam_width: int = 0,
+    ) -> None:
+        # extract model-specific parameters
+        self.config = dict(model["config"])
+        self.ngrams_start = self.config["ngrams_start"]
+        self.ngrams_end = self.config["ngrams_end"]
+        self.ngram_method = self.config["ngram_method"]
+        self.ngram_token = self.config["ngram_token"]
+        self.labels: List[str] = list(model["profiles"].keys())
+        self.metric = metric
+        self.normalization = normalization
+        self.beam_width = beam_width
+        self.group_labels: List[str] = []
+        self.members: List[Tuple[int, int]] = []
+        if self.beam_width > 0:
+            if "hierarchy" not in model:
+                raise ValueError("Model has no category hierarchy for beam search")
+            # keep member categories of each group in contiguous columns
+            groups = model["hierarchy"]["groups"]
+            self.group_labels = list(groups.keys())
+            bounds = np.cumsum(
+                [0] + [len(groups[group]) for group in self.group_labels]
+            )
+            self.members = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+            grouped = [label for group in self.group_labels for label in groups[group]]
+            self.labels = grouped + sorted(set(self.labels) - set(grouped))
+
+        # build shared vocabulary and collect profile entries with it as rows
+        self.vocabulary: typing.Dict[typing.Hashable, int] = {}
+        profiles = [model["profiles"][label] for label in self.labels]
+        if self.ngram_token in BYTE_TOKENS:
+            # restore integer byte n-gram keys stringified by JSON
+            profiles = [
+                {int(key): value for key, value in profile.items()}
+                for profile in profiles
+            ]
+        rows = np.concatenate(
+            [np.zeros(0, dtype=np.int64)]
+            + [
+                np.fromiter(
+                    (
+                        self.vocabulary.setdefault(key, len(self.vocabulary))
+                        for key in profile
+                    ),
+                    dtype=np.int64,
+                    count=len(profile),
+                )
+                for profile in profiles
+            ]
+        )
+        values = np.concatenate(
+            [np.zeros(0)]
+            + [
+                np.fromiter(profile.values(), dtype=np.float64, count=len(profile))
+                for profile in profiles
+            ]
+        )
+        columns = np.repeat(
+            np.arange(len(profiles)), [len(profile) for profile in profiles]
+        )
+        shape = (len(self.vocabulary), len(self.labels))
+
+        # choose backend based on profile density
+        if backend == "auto":
+            density = len(values) / max(1, shape[0] * shape[1])
+            backend = "sparse" if density < DENSITY_THRESHOLD else "dense"
+        self.backend = backend
+
+        # store profiles so document n-grams gather contiguous rows
+        if self.backend == "sparse":
+            self.weights = csr_matrix((values, (rows, columns)), shape=shape)
+            # share the sparsity structure and only store ones for the support
+            self.support = csr_matrix(
+                (
+                    np.ones_like(self.weights.data),
+                    self.weights.indices,
+                    self.weights.indptr,
+                ),
+                shape=shape,
+            )
+        else:
+            # derive the dense support from positive weights while scoring
+            self.weights = np.zeros(shape)
+            self.support = None
+            self.weights[rows, columns] = values
+            self.weights.setflags(write=False)
+
+        # pre-compute squared norms of category profiles
+        self.squared_norms = np.bincount(
+            columns, weights=np.square(values), minlength=len(self.labels)
+        )
+        self.squared_norms.setflags(write=False)
+
+        # store group profiles over the shared vocabulary for beam search
+        group_rows: List[int] = []
+        group_columns: List[int] = []
+        group_values: List[float] = []
+        for column, group in enumerate(self.group_labels):
+            for key, value in model["hierarchy"]["profiles"][group].items():
+                if self.ngram_token in BYTE_TOKENS:
+                    key = int(key)
+                # merged group n-grams always stem from member profiles
+                group_rows.append(self.vocabulary[key])
+                group_columns.append(column)
+                group_values.append(value)
+        group_shape = (len(self.vocabulary), len(self.group_labels))
+        if self.backend == "sparse":
+            self.group_weights = csr_matrix(
+                (group_values, (group_rows, group_columns)), shape=group_shape
+            )
+        else:
+            self.group_weights = np.zeros(group_shape)
+            self.group_weights[group_rows, group_columns] = group_values
+            self.group_weights.setflags(write=False)
+        self.group_norms = np.bincount(
+            np.asarray(group_columns, dtype=np.int64),
+            weights=np.square(group_values),
+            minlength=len(self.group_labels),
+        )
+        self.group_norms.setflags(write=False)
+
+    @classmethod
+    def from_path(cls, model_path: str, **kwargs) -> "Classifier":
+        """Create classifier from model JSON file"""
+        with open(model_path, "r") as input_file_stream:
+            return cls(json.load(input_file_stream), **kwargs)
+
+    def get_counter(self, doc: Document) -> typing.Counter:
+        """Gather n-gram statistics with the model's stored config"""
+        return get_ngram_stats(
+            doc,
+            self.ngrams_start,
+            self.ngrams_end,
+            self.ngram_method,
+            self.ngram_token,
+        )
+
+    def get_document_rows(
+        self, counters: List[typing.Counter]
+    ) -> Tuple[np.ndarray, np.ndarray, List[int], np.ndarray]:
+        """
+        Gather vocabulary rows and counts of document n-grams in CSR layout
+        together with the total n-gram count of every document
+        """
+        rows: List[int] = []
+        counts: List[int] = []
+        indptr = [0]
+        totals = np.zeros((len(counters), 1))
+        for index, counter in enumerate(counters):
+            for key, count in counter.items():
+                row = self.vocabulary.get(key)
+                if row is not None:
+                    rows.append(row)
+                    counts.append(count)
+            indptr.append(len(rows))
+            totals[index] = sum(counter.values())
+        return (
+            np.asarray(rows, dtype=np.int64),
+            np.asarray(counts, dtype=np.float64),
+            indptr,
+            totals,
+        )
+
+    def get_batch_distances(self, counters: List[typing.Counter]) -> np.ndarray:
+        """
+        Compute distances between document counters and all category
+        profiles, where categories sharing no n-grams with a document are
+        assigned an infinite distance
+        """
+        # gather document n-grams present in the vocabulary
+        rows, values, indptr, totals = self.get_document_rows(counters)
+
+        # compute per-category document sums, squares and profile products
+        if self.backend == "sparse":
+            documents = csr_matrix(
+                (values, rows, indptr), shape=(len(counters), len(self.vocabulary))
+            )
+            doc_sums = (documents @ self.support).toarray()
+            doc_squares = (documents.multiply(documents) @ self.support).toarray()
+            products = (documents @ self.weights).toarray()
+        else:
+            doc_sums = np.zeros((len(counters), len(self.labels)))
+            doc_squares = np.zeros_like(doc_sums)
+            products = np.zeros_like(doc_sums)
+            for index, (start, end) in enumerate(zip(indptr, indptr[1:])):
+                weights = self.weights[rows[start:end]]
+                support = weights > 0
+                doc_sums[index] = values[start:end] @ support
+                doc_squares[index] = np.square(values[start:end]) @ support
+                products[index] = values[start:end] @ weights
+
+        # return distances under configured metric
+        return self.get_scores(doc_sums, doc_squares, products, totals)
+
+    def get_scores(
+        self,
+        doc_sums: np.ndarray,
+        doc_squares: np.ndarray,
+        products: np.ndarray,
+        totals: np.ndarray,
+        squared_norms: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Compute distances from per-category document statistics, optionally
+        restricted to the categories with the given squared profile norms
+        """
+        if squared_norms is None:
+            squared_norms = self.squared_norms
+        distances = np.full(doc_sums.shape, np.inf)
+        mask = doc_sums > 0
+        squared_norms = np.broadcast_to(squared_norms, doc_sums.shape)[mask]
+
+        if self.metric == "cosine":
+            # cosine distance is invariant to document normalization
+            distances[mask] = 1.0 - products[mask] / np.sqrt(
+                doc_squares[mask] * squared_norms
+            )
+
+        elif self.metric == "euclidean":
+            # normalize documents over the profile support or all n-grams
+            if self.normalization == "support":
+                normalizers = doc_sums[mask]
+            elif self.normalization == "document":
+                normalizers = np.broadcast_to(totals, doc_sums.shape)[mask]
+            else:
+                raise ValueError("Unknown normalization: %s" % self.normalization)
+
+            # expand the squared distance of the normalized document vectors
+            squared = (
+                doc_squares[mask] / np.square(normalizers)
+                - 2 * products[mask] / normalizers
+                + squared_norms
+            )
+            distances[mask] = np.sqrt(np.maximum(squared, 0.0))
+
+        else:
+            raise ValueError("Unknown metric: %s" % self.metric)
+
+        # return final distances
+        return distances
+
+    def get_distances(self, counter: typing.Counter) -> np.ndarray:
+        """Compute distances between a document counter and all profiles"""
+        return self.get_batch_distances([counter])[0]
+
+    def get_size(self) -> int:
+        """Estimate memory held by profiles and vocabulary in bytes"""
+        arrays = [self.squared_norms, self.group_norms]
+        for matrix in (self.weights, self.group_weights):
+            if self.backend == "sparse":
+                arrays.extend([matrix.data, matrix.indices, matrix.indptr])
+            else:
+                arrays.append(matrix)
+        if self.backend == "sparse":
+            arrays.append(self.support.data)
+        return (
+            sum(array.nbytes for array in arrays)
+            + sys.getsizeof(self.vocabulary)
+            + sum(sys.getsizeof(key) for key in self.vocabulary)
+        )
+
+    def get_label(self, index: int) -> str:
+        """Map label index to category name"""
+        return self.labels[index] if index >= 0 else UNKNOWN
+
+    def get_block(self, rows: np.ndarray, ranges: List[Tuple[int, int]]) -> np.ndarray:
+        """Gather dense block of profile weights for contiguous category ranges"""
+        if not ranges:
+            return np.zeros((len(rows), 0))
+        if self.backend == "sparse":
+            weights = self.weights[rows]
+            return np.hstack([weights[:, start:end].toarray() for start, end in ranges])
+        return np.hstack([self.weights[rows, start:end] for start, end in ranges])
+
+    def get_block_distances(
+        self,
+        values: np.ndarray,
+        weights: np.ndarray,
+        total: np.ndarray,
+        squared_norms: np.ndarray,
+    ) -> np.ndarray:
+        """Compute distances of one document to a dense block of profiles"""
+        support = weights > 0
+        return self.get_scores(
+            (values @ support)[np.newaxis],
+            (np.square(values) @ support)[np.newaxis],
+            (values @ weights)[np.newaxis],
+            total[np.newaxis],
+            squared_norms,
+        )[0]
+
+    def predict_counters_hierarchical(
+        self, counters: List[typing.Counter]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict label indices and distances by scoring group profiles first
+        and then only categories of the `beam_width` closest groups, falling
+        back to all categories if none of them shares n-grams with a document
+        """
+        rows, values, indptr, totals = self.get_document_rows(counters)
+        indices = np.full(len(counters), -1, dtype=np.int64)
+        scores = np.full(len(counters), np.inf)
+
+        for index, (start, end) in enumerate(zip(indptr, indptr[1:])):
+            # keep closest groups sharing n-grams with the document
+            group_weights = self.group_weights[rows[start:end]]
+            if self.backend == "sparse":
+                group_weights = group_weights.toarray()
+            group_distances = self.get_block_distances(
+                values[start:end],
+                group_weights,
+                totals[index],
+                self.group_norms,
+            )
+            beam = [
+                self.members[group]
+                for group in np.argsort(group_distances)[: self.beam_width]
+                if np.isfinite(group_distances[group])
+            ]
+            candidates = (
+                np.concatenate([np.arange(lower, upper) for lower, upper in beam])
+                if beam
+                else np.zeros(0, dtype=np.int64)
+            )
+
+            # score document against member categories of those groups only
+            distances = self.get_block_distances(
+                values[start:end],
+                self.get_block(rows[start:end], beam),
+                totals[index],
+                self.squared_norms[candidates],
+            )
+            if len(distances) and np.isfinite(distances.min()):
+                best = int(np.argmin(distances))
+                indices[index], scores[index] = candidates[best], distances[best]
+                continue
+
+            # fall back to flat scoring
+            distances = self.get_distances(counters[index])
+            best = int(np.argmin(distances))
+            if np.isfinite(distances[best]):
+                indices[index], scores[index] = best, distances[best]
+
+        # return final predictions
+        return indices, scores
+
+    def predict_counters(
+        self, counters: List[typing.Counter]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict label indices and distances for a batch of document counters,
+        where undetectable documents are assigned index -1 and infinite distance
+        """
+        if self.beam_width > 0:
+            return self.predict_counters_hierarchical(counters)
+        distances = self.get_batch_distances(counters)
+        indices = np.argmin(distances, axis=1)
+        scores = distances[np.arange(len(distances)), indices]
+        indices[np.isinf(scores)] = -1
+        return indices, scores
+
+    def predict_batch(self, docs: Iterable[Document]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict label indices and distances for a batch of documents, where
+        undetectable documents are assigned index -1 and infinite distance
+        """
+        return self.predict_counters([self.get_counter(doc) for doc in docs])
+
+    def get_chunk_end(self, doc: Document, start: int, chunk_size: int) -> int:
+        """
+        Find end of the prefix chunk starting at `start`, extended up to the
+        next whitespace and past any bracketed span that document cleaning
+        removes as a whole
+        """
+        end = min(start + chunk_size, len(doc))
+        while True:
+            while end < len(doc) and not doc[end : end + 1].isspace():
+                end += 1
+            if not isinstance(doc, str):
+                return end
+
+            # continue after the closing bracket of a span still open, if any
+            opened = doc.rfind("[", start, end) > doc.rfind("]", start, end)
+            bracket = BRACKETS.search(doc, end)
+            if not opened or bracket is None or bracket.group() != "]":
+                return end
+            end = bracket.end()
+
+    def predict_early_exit(
+        self,
+        doc: Document,
+        chunk_size: int = 200,
+        min_margin: float = 0.1,
+        patience: int = 2,
+    ) -> Tuple[int, float, float]:
+        """
+        Predict label index and distance of a document by extracting
+        n-grams over growing prefix chunks, stopping once the relative
+        margin between the best and second-best distances stays above
+        `min_margin` with the same winner for `patience` re-scores;
+        also returns the fraction of the document consumed
+
+        Chunks are counted incrementally when n-grams never span words,
+        otherwise the whole prefix is re-extracted so that consuming the
+        full document always matches `predict`
+        """
+        if self.beam_width > 0:
+            raise ValueError("Early exit scores all categories, not beam search")
+        if isinstance(doc, bytes) and self.ngram_token not in BYTE_TOKENS:
+            doc = doc.decode("utf8", errors="replace")
+        incremental = (
+            self.ngram_method == "normal" and self.ngram_token in WORD_LOCAL_TOKENS
+        )
+        counter: typing.Counter = Counter()
+        distances = np.full(len(self.labels), np.inf)
+        winner, stable, start = -1, 0, 0
+        while start < len(doc):
+            # extend prefix without splitting words or cleaned spans
+            end = self.get_chunk_end(doc, start, chunk_size)
+            if incremental:
+                counter.update(self.get_counter(doc[start:end]))
+            else:
+                counter = self.get_counter(doc[:end])
+            start = end
+
+            # re-score prefix and track stability of the winner
+            distances = self.get_distances(counter)
+            ranking = np.argsort(distances)
+            best = ranking[0]
+            second = distances[ranking[1]] if len(ranking) > 1 else np.inf
+            if not np.isfinite(distances[best]):
+                margin = 0.0
+            elif not np.isfinite(second):
+                # a single matching category is the most confident case
+                margin = 1.0
+            elif second > 0:
+                margin = (second - distances[best]) / second
+            else:
+                margin = 0.0
+            if margin >= min_margin and best == winner:
+                stable += 1
+            elif margin >= min_margin:
+                winner, stable = best, 1
+            else:
+                winner, stable = -1, 0
+            if stable >= patience:
+                break
+
+        # return prediction with consumed fraction
+        index = int(np.argmin(distances))
+        if np.isinf(distances[index]):
+            return -1, np.inf, start / len(doc) if doc else 1.0
+        return index, float(distances[index]), start / len(doc) if doc else 1.0
+
+    def predict_batch_early_exit(
+        self,
+        docs: Iterable[Document],
+        chunk_size: int = 200,
+        min_margin: float = 0.1,
+        patience: int = 2,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Predict label indices, distances and consumed document fractions for
+        a batch of documents with confidence-based early exit
+        """
+        results = [
+            self.predict_early_exit(doc, chunk_size, min_margin, patience)
+            for doc in docs
+        ]
+        indices, scores, consumed = zip(*results) if results else ((), (), ())
+        return (
+            np.array(indices, dtype=np.int64),
+            np.array(scores, dtype=np.float64),
+            np.array(consumed, dtype=np.float64),
+        )
+
+    def predict(self, doc: Document) -> str:
+        """Predict category of a single document"""
+        indices, _ = self.predict_batch([doc])
+        return self.get_label(indices[0])
+
+    def predict_iter(
+        self, docs: Iterable[Document], batch_size: int = 64
+    ) -> Iterator[Tuple[str, float]]:
+        """Lazily predict categories and distances over a document stream"""
+        docs = iter(docs)
+        while True:
+            batch = list(islice(docs, batch_size))
+            if not batch:
+                return
+            indices, scores = self.predict_batch(batch)
+            for index, score in zip(indices, scores):
+                yield self.get_label(index), float(score)
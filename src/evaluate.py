@@ -2,15 +2,27 @@
 # -*- coding: utf-8 -*-
 
 from math import sqrt
+from time import perf_counter
 import numpy as np
 from numpy import dot
 from numpy.linalg import norm
 from tqdm import tqdm
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple
+from itertools import islice
+from collections import Counter
 from sklearn.metrics import classification_report
-from .utils import ArgparseFormatter, file_path, dir_path, get_formatted_logger
+from .utils import (
+    ArgparseFormatter,
+    file_path,
+    dir_path,
+    get_formatted_logger,
+    get_tuned_defaults,
+)
+from .classifier import Classifier, Document
 from .train import (
+    BYTE_TOKENS,
     read_data_from_path,
+    iter_data_from_directory,
     read_data_from_dataloader,
     get_clean_doc,
     get_ngram_stats,
@@ -67,64 +79,399 @@ def get_diff_norms(counter: typing.Counter, model: dict) -> List[Tuple[str, floa
     return diff_norms
 
 
-def main(args: argparse.Namespace) -> None:
-    """Main workflow to evaluate categories detection models"""
-    # read in data and labels to memory
-    LOGGER.info("Reading data")
-    data, labels = read_data_from_dataloader(
-        fetch_20newsgroups, subset="test", remove=("headers", "footers", "quotes")
+def get_predictions(
+    data: List[Document], classifier: Classifier
+) -> Tuple[List[str], float]:
+    """Detect categories and measure time spent scoring against profiles"""
+    predictions = []
+    scoring_time = 0.0
+
+    # iterate over all documents
+    for doc in tqdm(data):
+        # compute n-gram statistics and update counter
+        counter = classifier.get_counter(doc)
+
+        # compute closest category
+        start = perf_counter()
+        indices, _ = classifier.predict_counters([counter])
+        scoring_time += perf_counter() - start
+
+        predictions.append(classifier.get_label(indices[0]))
+
+    # return predictions and scoring time
+    return predictions, scoring_time
+
+
+def read_checkpoint(checkpoint_path: str, source: dict) -> dict:
+    """
+    Read evaluation checkpoint or start a fresh one, refusing to resume
+    a checkpoint produced by a different model or data source
+    """
+    if not os.path.isfile(checkpoint_path):
+        return {"documents": 0, "results_bytes": 0, "confusion": [], "source": source}
+    with open(checkpoint_path, "r") as input_file_stream:
+        checkpoint = json.load(input_file_stream)
+
+    # compare through JSON to ignore tuple/list and key order differences
+    if json.loads(json.dumps(source)) != checkpoint.get("source"):
+        raise ValueError(
+            "Checkpoint %s was produced by a different model or data source, "
+            "remove it or choose another results file" % checkpoint_path
+        )
+    return checkpoint
+
+
+def dump_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+    """Atomically replace evaluation checkpoint on disk"""
+    temporary_path = "%s.tmp" % checkpoint_path
+    with open(temporary_path, "w") as output_file_stream:
+        json.dump(checkpoint, output_file_stream, ensure_ascii=False)
+        output_file_stream.flush()
+        os.fsync(output_file_stream.fileno())
+    os.replace(temporary_path, checkpoint_path)
+
+
+def get_confusion_report(confusion: typing.Counter) -> dict:
+    """Produce classification report from a confusion counter"""
+    # expand confusion counter into weighted label pairs
+    pairs = sorted(confusion.items())
+    report = classification_report(
+        [label for (label, _), _ in pairs],
+        [prediction for (_, prediction), _ in pairs],
+        sample_weight=[count for _, count in pairs],
+        output_dict=True,
     )
-    # data, labels = read_data_from_path(args.test_data, args.test_labels)
 
+    # restore integral supports lost through sample weights
+    for value in report.values():
+        if isinstance(value, dict):
+            value["support"] = int(round(value["support"]))
+    return report
+
+
+def get_checkpointed_report(
+    pairs: Iterable[Tuple[Document, str]],
+    classifier: Classifier,
+    results_path: str,
+    chunk_size: int,
+    source: Optional[dict] = None,
+) -> dict:
+    """
+    Detect categories in chunks while appending predictions to disk and
+    checkpointing a running confusion counter, resuming after the last
+    completed chunk if a checkpoint from the same `source` already exists
+    """
+    if source is None:
+        source = {"config": classifier.config}
+    checkpoint_path = "%s.checkpoint" % results_path
+    checkpoint = read_checkpoint(checkpoint_path, source)
+    confusion: typing.Counter = Counter(
+        {
+            (label, prediction): count
+            for label, prediction, count in checkpoint["confusion"]
+        }
+    )
+
+    # skip documents from completed chunks
+    pairs = iter(pairs)
+    if checkpoint["documents"]:
+        LOGGER.info("Resuming after %s documents" % checkpoint["documents"])
+        for _ in tqdm(islice(pairs, checkpoint["documents"])):
+            pass
+
+    # refuse to pad results lost or cut short since the last checkpoint
+    results_bytes = os.path.getsize(results_path) if os.path.isfile(results_path) else 0
+    if results_bytes < checkpoint["results_bytes"]:
+        raise ValueError(
+            "Results file %s is shorter than its checkpoint %s, "
+            "remove the checkpoint to start over" % (results_path, checkpoint_path)
+        )
+
+    # discard predictions written after the last checkpoint
+    with open(results_path, "a") as output_file_stream:
+        output_file_stream.truncate(checkpoint["results_bytes"])
+
+    with open(results_path, "a") as output_file_stream, tqdm(
+        initial=checkpoint["documents"]
+    ) as progress:
+        while True:
+            chunk = list(islice(pairs, chunk_size))
+            if not chunk:
+                break
+
+            # detect categories and append them to results
+            indices, _ = classifier.predict_batch([doc for doc, _ in chunk])
+            for (_, label), index in zip(chunk, indices):
+                prediction = classifier.get_label(index)
+                output_file_stream.write("%s\t%s\n" % (label, prediction))
+                confusion[(label, prediction)] += 1
+            output_file_stream.flush()
+            os.fsync(output_file_stream.fileno())
+
+            # checkpoint completed chunk
+            checkpoint["documents"] += len(chunk)
+            checkpoint["results_bytes"] = output_file_stream.tell()
+            checkpoint["confusion"] = [
+                [label, prediction, count]
+                for (label, prediction), count in confusion.items()
+            ]
+            dump_checkpoint(checkpoint_path, checkpoint)
+            progress.update(len(chunk))
+
+    # return final classification report
+    return get_confusion_report(confusion)
+
+
+def get_model_size(model: dict) -> dict:
+    """Compute size statistics of category profiles"""
+    return {
+        "profile_entries": sum(len(profile) for profile in model["profiles"].values()),
+        "unique_ngrams": len(
+            {key for profile in model["profiles"].values() for key in profile}
+        ),
+        "json_bytes": len(json.dumps(model, ensure_ascii=False).encode("utf8")),
+    }
+
+
+def get_report_deltas(report: dict, baseline_report: dict) -> dict:
+    """Compute differences between two classification reports"""
+    deltas: dict = {}
+    for key, value in report.items():
+        if key not in baseline_report:
+            continue
+        if isinstance(value, dict):
+            deltas[key] = {
+                metric: value[metric] - baseline_report[key][metric] for metric in value
+            }
+        else:
+            deltas[key] = value - baseline_report[key]
+    return deltas
+
+
+def get_report_name(model: dict) -> str:
+    """Create classification report file name from model config"""
+    report_name = "classification_report_%s_to_%s_%s_%s_%s.json" % (
+        model["config"]["ngrams_start"],
+        model["config"]["ngrams_end"],
+        model["config"]["ngram_cutoff"],
+        model["config"]["ngram_method"],
+        model["config"]["ngram_token"],
+    )
+    ngram_selection = model["config"].get("ngram_selection", "frequency")
+    if ngram_selection != "frequency":
+        report_name = report_name.replace(".json", "_%s.json" % ngram_selection)
+    return report_name
+
+
+def main(args: argparse.Namespace) -> None:
+    """Main workflow to evaluate categories detection models"""
     # read model into memory
     LOGGER.info("Reading model: %s" % args.model)
     with open(args.model, "r") as input_file_stream:
         model = json.load(input_file_stream)
 
-    # extract model-specific parameters
-    ngrams_start = model["config"]["ngrams_start"]
-    ngrams_end = model["config"]["ngrams_end"]
-    ngram_method = model["config"]["ngram_method"]
-    ngram_token = model["config"]["ngram_token"]
-    predictions = []
+    # prepare classifier with scoring options
+    classifier = Classifier(
+        model,
+        metric=args.metric,
+        normalization=args.normalization,
+        backend=args.backend,
+        beam_width=args.beam_width,
+    )
+    LOGGER.info("Scoring with %s backend" % classifier.backend)
 
-    # iterate over all categories and update dictionary
-    LOGGER.info("Detecting categories sequentially, this might take some time")
-    for doc in tqdm(data):
-        # compute n-gram statistics and update counter
-        counter = get_ngram_stats(
-            doc, ngrams_start, ngrams_end, ngram_method, ngram_token
+    # read data to memory unless streamed from disk through checkpointed chunks
+    data: List[Document] = []
+    labels: List[str] = []
+    if args.results_file and args.test_directory:
+        LOGGER.info("Deferring data reading to checkpointed chunks")
+    elif args.test_directory:
+        # read corpus tree to memory concurrently
+        LOGGER.info("Reading data from: %s" % args.test_directory)
+        for doc, label in tqdm(
+            iter_data_from_directory(
+                args.test_directory,
+                args.io_workers,
+                binary=classifier.ngram_token in BYTE_TOKENS,
+            )
+        ):
+            data.append(doc)
+            labels.append(label)
+    else:
+        # read in data and labels to memory
+        LOGGER.info("Reading data")
+        test_data, labels = read_data_from_dataloader(
+            fetch_20newsgroups, subset="test", remove=("headers", "footers", "quotes")
         )
+        data.extend(test_data)
+        # data, labels = read_data_from_path(args.test_data, args.test_labels)
 
-        # compute closest category
-        diff_norms = get_diff_norms(counter, model)
-
-        if diff_norms != []:
-            predictions.append(sorted(diff_norms, key=lambda x: x[1])[0][0])
+    if args.results_file:
+        # stream documents through checkpointed chunks
+        LOGGER.info("Detecting categories in checkpointed chunks")
+        pairs: Iterable[Tuple[Document, str]]
+        if args.test_directory:
+            pairs = iter_data_from_directory(
+                args.test_directory,
+                args.io_workers,
+                binary=classifier.ngram_token in BYTE_TOKENS,
+            )
+            data_source = {"test_directory": os.path.abspath(args.test_directory)}
         else:
-            predictions.append("Unknown")
-
-    # produce classification report
-    report = classification_report(labels, predictions, output_dict=True)
-    report_path = os.path.join(
-        args.models_directory,
-        "reports",
-        "euclidean",
-        "classification_report_%s_to_%s_%s_%s_%s.json"
-        % (
-            ngrams_start,
-            ngrams_end,
-            model["config"]["ngram_cutoff"],
-            ngram_method,
-            ngram_token,
-        ),
-    )
+            # chunk the same test set as the in-memory path
+            pairs = zip(data, labels)
+            data_source = {"dataloader": "20newsgroups", "subset": "test"}
+
+        # tie checkpoint to everything affecting predictions
+        source = {
+            "model": os.path.abspath(args.model),
+            "config": model["config"],
+            "metric": args.metric,
+            "normalization": args.normalization,
+            "beam_width": args.beam_width,
+            "data": data_source,
+        }
+        report = get_checkpointed_report(
+            pairs, classifier, args.results_file, args.chunk_size, source
+        )
+    elif args.early_exit:
+        # stop reading documents once the winning category is stable
+        LOGGER.info("Detecting categories with early exit")
+        indices, _, consumed = classifier.predict_batch_early_exit(
+            tqdm(data),
+            args.early_exit_chunk_size,
+            args.early_exit_margin,
+            args.early_exit_patience,
+        )
+        predictions = [classifier.get_label(index) for index in indices]
+        lengths = np.array([len(doc) for doc in data])
+        LOGGER.info(
+            "Consumed %.1f%% of characters, median document fraction %.3f"
+            % (
+                100 * np.dot(consumed, lengths) / max(1, lengths.sum()),
+                np.median(consumed),
+            )
+        )
+
+        # produce classification report with consumption statistics
+        report = classification_report(labels, predictions, output_dict=True)
+        report["early_exit"] = {
+            "chunk_size": args.early_exit_chunk_size,
+            "margin": args.early_exit_margin,
+            "patience": args.early_exit_patience,
+            "consumed": consumed.tolist(),
+        }
+    else:
+        # iterate over all categories and update dictionary
+        LOGGER.info("Detecting categories sequentially, this might take some time")
+        predictions, scoring_time = get_predictions(data, classifier)
+
+        # produce classification report
+        report = classification_report(labels, predictions, output_dict=True)
+    report_directory = os.path.join(args.models_directory, "reports", args.metric)
+    os.makedirs(report_directory, exist_ok=True)
+    report_path = os.path.join(report_directory, get_report_name(model))
+    if args.early_exit:
+        report_path = report_path.replace(".json", "_early_exit.json")
+    elif args.beam_width:
+        report_path = report_path.replace(".json", "_beam_%s.json" % args.beam_width)
 
     # dump classification report
     LOGGER.info("Dumping classification report: %s" % report_path)
     with open(report_path, "w") as output_file_stream:
         json.dump(report, output_file_stream)
 
+    # compare coarse-to-fine against flat scoring if requested
+    if args.beam_width and not (args.results_file or args.early_exit):
+        LOGGER.info("Detecting categories with flat scoring")
+        flat_classifier = Classifier(
+            model,
+            metric=args.metric,
+            normalization=args.normalization,
+            backend=args.backend,
+        )
+        flat_predictions, flat_scoring_time = get_predictions(data, flat_classifier)
+        flat_report = classification_report(labels, flat_predictions, output_dict=True)
+
+        # collect timing and report differences
+        hierarchy_comparison = {
+            "model": args.model,
+            "groups": len(model["hierarchy"]["groups"]),
+            "beam_width": args.beam_width,
+            "scoring_seconds": scoring_time,
+            "flat_scoring_seconds": flat_scoring_time,
+            "speedup": flat_scoring_time / max(scoring_time, 1e-12),
+            "report_deltas": get_report_deltas(report, flat_report),
+        }
+        LOGGER.info(
+            "Scoring time: %.2fs vs. %.2fs flat (%.2fx speedup), "
+            "accuracy delta: %+.4f"
+            % (
+                scoring_time,
+                flat_scoring_time,
+                hierarchy_comparison["speedup"],
+                hierarchy_comparison["report_deltas"].get("accuracy", 0.0),
+            )
+        )
+
+        # dump hierarchy comparison report
+        hierarchy_path = report_path.replace(
+            "classification_report_", "hierarchy_report_"
+        )
+        LOGGER.info("Dumping hierarchy report: %s" % hierarchy_path)
+        with open(hierarchy_path, "w") as output_file_stream:
+            json.dump(hierarchy_comparison, output_file_stream)
+
+    # compare against baseline model if provided
+    if args.baseline_model:
+        LOGGER.info("Reading baseline model: %s" % args.baseline_model)
+        with open(args.baseline_model, "r") as input_file_stream:
+            baseline_model = json.load(input_file_stream)
+
+        LOGGER.info("Detecting categories with baseline model")
+        baseline_classifier = Classifier(
+            baseline_model,
+            metric=args.metric,
+            normalization=args.normalization,
+            backend=args.backend,
+        )
+        baseline_predictions, baseline_scoring_time = get_predictions(
+            data, baseline_classifier
+        )
+        baseline_report = classification_report(
+            labels, baseline_predictions, output_dict=True
+        )
+
+        # collect size, timing and report differences
+        comparison = {
+            "model": args.model,
+            "baseline_model": args.baseline_model,
+            "model_size": get_model_size(model),
+            "baseline_model_size": get_model_size(baseline_model),
+            "scoring_seconds": scoring_time,
+            "baseline_scoring_seconds": baseline_scoring_time,
+            "report_deltas": get_report_deltas(report, baseline_report),
+        }
+        LOGGER.info(
+            "Profile entries: %s vs. %s, scoring time: %.2fs vs. %.2fs, "
+            "accuracy delta: %+.4f"
+            % (
+                comparison["model_size"]["profile_entries"],
+                comparison["baseline_model_size"]["profile_entries"],
+                scoring_time,
+                baseline_scoring_time,
+                comparison["report_deltas"].get("accuracy", 0.0),
+            )
+        )
+
+        # dump comparison report
+        comparison_path = report_path.replace(
+            "classification_report_", "comparison_report_"
+        )
+        LOGGER.info("Dumping comparison report: %s" % comparison_path)
+        with open(comparison_path, "w") as output_file_stream:
+            json.dump(comparison, output_file_stream)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(formatter_class=ArgparseFormatter)
@@ -134,18 +481,99 @@ if __name__ == "__main__":
         default="./models/euclidean/model_3_300_normal_char.json",
         help="Path to model JSON file",
     )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--baseline-model",
+        type=file_path,
+        help="Path to baseline model JSON file to compare against",
+    )
+    mode.add_argument(
+        "--results-file",
+        type=str,
+        help="Path to append predictions to in resumable checkpointed chunks",
+    )
+    mode.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="Stop reading documents once the winning category is stable",
+    )
+    parser.add_argument(
+        "--early-exit-chunk-size",
+        type=int,
+        default=200,
+        help="Number of characters added to the prefix between re-scores",
+    )
+    parser.add_argument(
+        "--early-exit-margin",
+        type=float,
+        default=0.1,
+        help="Minimum relative distance margin between best and second-best "
+        "categories",
+    )
+    parser.add_argument(
+        "--early-exit-patience",
+        type=int,
+        default=2,
+        help="Number of consecutive re-scores the margin has to hold",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1000,
+        help="Number of documents per checkpointed chunk",
+    )
     parser.add_argument(
         "--test-data",
-        type=file_path,
+        type=str,
         default="./data/wili-2018/x_test.txt",
         help="Path to test data",
     )
     parser.add_argument(
         "--test-labels",
-        type=file_path,
+        type=str,
         default="./data/wili-2018/y_test.txt",
         help="Path to test labels",
     )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        default="euclidean",
+        choices=["euclidean", "cosine"],
+        help="Distance between documents and category profiles",
+    )
+    parser.add_argument(
+        "--normalization",
+        type=str,
+        default="support",
+        choices=["support", "document"],
+        help="Normalize documents over each profile's n-grams or all n-grams",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="auto",
+        choices=["auto", "dense", "sparse"],
+        help="Storage of category profiles for scoring",
+    )
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        default=0,
+        help="Number of closest category groups whose categories are scored "
+        "and compared against flat scoring, or flat scoring only if 0",
+    )
+    parser.add_argument(
+        "--test-directory",
+        type=dir_path,
+        help="Path to test corpus tree with one sub-directory per category, "
+        "used instead of test data and labels if provided",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=8,
+        help="Number of threads reading documents from the corpus tree",
+    )
     parser.add_argument(
         "--models-directory",
         type=dir_path,
@@ -159,5 +587,9 @@ if __name__ == "__main__":
         default="info",
         type=str,
     )
+    parser.set_defaults(**get_tuned_defaults("evaluate"))
     LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
-    main(parser.parse_args())
+    args = parser.parse_args()
+    if args.early_exit and args.beam_width:
+        parser.error("argument --beam-width: not allowed with argument --early-exit")
+    main(args)
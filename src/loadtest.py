@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from time import perf_counter, sleep
+from bisect import bisect_right
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+from .utils import (
+    ArgparseFormatter,
+    check_file_paths,
+    file_path,
+    get_formatted_logger,
+)
+from .classifier import Classifier
+import numpy as np
+import threading
+import argparse
+import socket
+import typing
+import queue
+import json
+
+PERCENTILES = {"p50": 50.0, "p90": 90.0, "p99": 99.0, "p999": 99.9}
+# classification call together with a call releasing its resources
+Target = Tuple[Callable[[str], str], Callable[[], None]]
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of integer microsecond latencies, keeping the
+    `significant_bits` most significant bits of every value so that the
+    relative error stays below 2 ** -(significant_bits - 1)
+    """
+
+    def __init__(self, significant_bits: int = 7) -> None:
+        self.significant_bits = significant_bits
+        self.counts: typing.Counter = Counter()
+        self.total = 0
+        self.minimum: Optional[int] = None
+        self.maximum = 0
+        self.sum = 0
+
+    def record(self, microseconds: int) -> None:
+        """Record a single latency value"""
+        shift = max(0, microseconds.bit_length() - self.significant_bits)
+        self.counts[(microseconds >> shift) << shift] += 1
+        self.total += 1
+        self.sum += microseconds
+        self.maximum = max(self.maximum, microseconds)
+        self.minimum = (
+            microseconds if self.minimum is None else min(self.minimum, microseconds)
+        )
+
+    def get_percentile(self, percentile: float) -> int:
+        """
+        Compute highest value equivalent to the lowest recorded bucket at or
+        above the given percentile, so that latencies are never understated
+        """
+        if not self.total:
+            return 0
+        threshold = percentile / 100 * self.total
+        cumulative = 0
+        for value in sorted(self.counts):
+            cumulative += self.counts[value]
+            if cumulative >= threshold:
+                shift = max(0, value.bit_length() - self.significant_bits)
+                return min(value + (1 << shift) - 1, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict:
+        """Summarize histogram for JSON output"""
+        return {
+            "unit": "us",
+            "significant_bits": self.significant_bits,
+            "total": self.total,
+            "min": self.minimum or 0,
+            "max": self.maximum,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "percentiles": {
+                name: self.get_percentile(percentile)
+                for name, percentile in PERCENTILES.items()
+            },
+            "counts": {str(value): self.counts[value] for value in sorted(self.counts)},
+        }
+
+
+def get_bucket_names(length_buckets: List[int]) -> List[str]:
+    """Name document-length buckets delimited by the given boundaries"""
+    bounds = [0] + length_buckets
+    names = ["%s-%s" % (lower, upper - 1) for lower, upper in zip(bounds, bounds[1:])]
+    return names + ["%s+" % bounds[-1]]
+
+
+def get_arrival_offsets(
+    requests: int, rate: float, arrival: str, seed: int
+) -> np.ndarray:
+    """Compute intended send offsets in seconds for an open-loop schedule"""
+    if arrival == "poisson":
+        gaps = np.random.default_rng(seed).exponential(1 / rate, requests)
+        return np.cumsum(gaps) - gaps[0]
+    return np.arange(requests) / rate
+
+
+def get_local_target(classifier: Classifier) -> Target:
+    """Create in-process classification target"""
+    return classifier.predict, lambda: None
+
+
+def get_socket_target(host: str, port: int) -> Target:
+    """Create classification target over one persistent local connection"""
+    connection = socket.create_connection((host, port))
+    stream = connection.makefile("rwb")
+
+    def target(doc: str) -> str:
+        stream.write(doc.encode("utf8") + b"\n")
+        stream.flush()
+        return stream.readline().decode("utf8").rstrip("\n")
+
+    def close() -> None:
+        stream.close()
+        connection.close()
+
+    return target, close
+
+
+def run_load(
+    docs: List[str],
+    get_target: Callable[[], Target],
+    requests: int,
+    concurrency: int,
+    rate: float,
+    arrival: str,
+    length_buckets: List[int],
+    seed: int = 42,
+) -> dict:
+    """
+    Replay documents against a classification target with a fixed number
+    of workers, either closed-loop when `rate` is zero or open-loop at the
+    given arrival rate, where latencies are measured from the intended send
+    time to account for queueing behind slow requests
+
+    Every worker creates its own target and closes it once the schedule is
+    exhausted
+    """
+    bucket_names = get_bucket_names(length_buckets)
+    histograms = {name: LatencyHistogram() for name in ["all"] + bucket_names}
+    lock = threading.Lock()
+    schedule: "queue.Queue[Optional[Tuple[int, float]]]" = queue.Queue()
+
+    # enqueue all requests with intended send offsets up front
+    offsets = (
+        get_arrival_offsets(requests, rate, arrival, seed)
+        if rate > 0
+        else np.zeros(requests)
+    )
+    for index, offset in enumerate(offsets):
+        schedule.put((index, float(offset)))
+    for _ in range(concurrency):
+        schedule.put(None)
+
+    def worker() -> None:
+        target, close = get_target()
+        try:
+            while True:
+                item = schedule.get()
+                if item is None:
+                    return
+                index, offset = item
+                doc = docs[index % len(docs)]
+
+                # wait for intended send time in open-loop mode
+                intended = start + offset
+                delay = intended - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                if rate <= 0:
+                    intended = perf_counter()
+                target(doc)
+                latency = int((perf_counter() - intended) * 1e6)
+
+                # record latency overall and per document-length bucket
+                bucket = bucket_names[bisect_right(length_buckets, len(doc))]
+                with lock:
+                    histograms["all"].record(latency)
+                    histograms[bucket].record(latency)
+        finally:
+            close()
+
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = perf_counter() - start
+
+    # summarize latencies and achieved throughput
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "rate": rate,
+        "arrival": arrival if rate > 0 else "closed",
+        "elapsed_seconds": elapsed,
+        "buckets": {
+            name: dict(histogram.to_dict(), throughput=histogram.total / elapsed)
+            for name, histogram in histograms.items()
+        },
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    """Main workflow to measure classification latency under load"""
+    # read in documents to replay
+    LOGGER.info("Reading data from disk")
+    with open(args.data, "r") as input_file_stream:
+        docs = [line.strip() for line in input_file_stream]
+
+    # prepare target factory, one target per worker
+    get_target: Callable[[], Target]
+    if args.target == "local":
+        LOGGER.info("Reading model: %s" % args.model)
+        classifier = Classifier.from_path(args.model, backend=args.backend)
+        get_target = lambda: get_local_target(classifier)  # noqa: E731
+    else:
+        get_target = lambda: get_socket_target(args.host, args.port)  # noqa: E731
+
+    # warm up target before measuring
+    if args.warmup:
+        LOGGER.info("Warming up with %s requests" % args.warmup)
+        run_load(docs, get_target, args.warmup, args.concurrency, 0, "fixed", [])
+
+    # run measured load
+    requests = args.requests or len(docs)
+    LOGGER.info(
+        "Sending %s requests with %s workers at %s"
+        % (
+            requests,
+            args.concurrency,
+            "%s requests/s" % args.rate if args.rate > 0 else "closed loop",
+        )
+    )
+    results = run_load(
+        docs,
+        get_target,
+        requests,
+        args.concurrency,
+        args.rate,
+        args.arrival,
+        args.length_buckets,
+        args.seed,
+    )
+    results["target"] = args.target
+    results["model"] = args.model if args.target == "local" else None
+    for name, bucket in results["buckets"].items():
+        LOGGER.info(
+            "%s: %s requests, %.1f/s, %s"
+            % (
+                name,
+                bucket["total"],
+                bucket["throughput"],
+                ", ".join(
+                    "%s %.2fms" % (percentile, value / 1000)
+                    for percentile, value in bucket["percentiles"].items()
+                ),
+            )
+        )
+
+    # dump histograms
+    LOGGER.info("Dumping load test results: %s" % args.output)
+    with open(args.output, "w") as output_file_stream:
+        json.dump(results, output_file_stream, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=ArgparseFormatter)
+    required = parser.add_argument_group("required arguments")
+    required.add_argument(
+        "--data",
+        type=file_path,
+        required=True,
+        help="Path to documents to replay, one per line",
+    )
+    parser.add_argument(
+        "--target",
+        type=str,
+        default="local",
+        choices=["local", "socket"],
+        help="Classify in-process or through a server started with src.serve",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="./models/model_3_300.json",
+        help="Path to model JSON file for local target",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="auto",
+        choices=["auto", "dense", "sparse"],
+        help="Storage of category profiles for local target",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address of socket target",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port of socket target",
+    )
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=0,
+        help="Number of requests to send, cycling through documents "
+        "(default: one per document)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=100,
+        help="Number of unmeasured requests sent beforehand",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of concurrent workers",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Open-loop arrival rate in requests per second, or closed loop if 0",
+    )
+    parser.add_argument(
+        "--arrival",
+        type=str,
+        default="fixed",
+        choices=["fixed", "poisson"],
+        help="Spacing of open-loop arrivals",
+    )
+    parser.add_argument(
+        "--length-buckets",
+        type=int,
+        nargs="+",
+        default=[100, 500, 2000],
+        help="Document length boundaries in characters for latency buckets",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Random seed for Poisson arrivals",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="./models/loadtest.json",
+        help="Path to dump latency histograms",
+    )
+    parser.add_argument(
+        "--logging-level",
+        help="Set logging level",
+        choices=["debug", "info", "warning", "error", "critical"],
+        default="info",
+        type=str,
+    )
+    LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
+    args = parser.parse_args()
+    if args.target == "local":
+        check_file_paths(parser, args, "model")
+    main(args)
@@ -2,48 +2,50 @@
 # -*- coding: utf-8 -*-
 
 from tqdm import tqdm
-from .utils import ArgparseFormatter, file_path, get_formatted_logger
-from .train import get_clean_doc, get_ngram_stats
-from .evaluate import get_diff_norms
+from .utils import (
+    ArgparseFormatter,
+    file_path,
+    get_formatted_logger,
+    get_tuned_defaults,
+)
+from .classifier import Classifier, Document
+from .train import BYTE_TOKENS
+from typing import List
 import argparse
-import json
 
 
 def main(args: argparse.Namespace) -> None:
     """Main workflow to detect categories"""
-    # read in data and labels to memory
-    LOGGER.info("Reading data from disk")
-    with open(args.predict_data, "r") as input_file_stream:
-        data = [line.strip() for line in input_file_stream]
-
     # read model into memory
     LOGGER.info("Reading model: %s" % args.model)
-    with open(args.model, "r") as input_file_stream:
-        model = json.load(input_file_stream)
+    classifier = Classifier.from_path(
+        args.model,
+        metric=args.metric,
+        normalization=args.normalization,
+        backend=args.backend,
+        beam_width=args.beam_width,
+    )
 
-    # extract model-specific parameters
-    ngrams_start = model["config"]["ngrams_start"]
-    ngrams_end = model["config"]["ngrams_end"]
-    predictions = []
+    # read in data to memory, as raw bytes for byte n-gram models
+    LOGGER.info("Reading data from disk")
+    if classifier.ngram_token in BYTE_TOKENS:
+        with open(args.predict_data, "rb") as input_file_stream:
+            data: List[Document] = [line.strip() for line in input_file_stream]
+    else:
+        with open(args.predict_data, "r") as input_file_stream:
+            data = [line.strip() for line in input_file_stream]
 
-    # iterate over all categories and update dictionary
+    # iterate over all documents in batches
     LOGGER.info("Detecting categories sequentially")
-    for doc in tqdm(data):
-        # clean document
-        doc = get_clean_doc(doc)
-
-        # compute n-gram statistics and update counter
-        counter = get_ngram_stats(doc, ngrams_start, ngrams_end)
-
-        # compute closest category
-        diff_norms = get_diff_norms(counter, model)
-        if diff_norms != []:
-            predictions.append(sorted(diff_norms, key=lambda x: x[1])[0][0])
-        else:
-            predictions.append("Unknown")
+    predictions = [
+        prediction
+        for prediction, _ in tqdm(
+            classifier.predict_iter(data, batch_size=args.batch_size), total=len(data)
+        )
+    ]
 
     # print final results
-    for doc, prediction in zip(data, predictions):
+    for prediction in predictions:
         print("%s" % prediction)
 
 
@@ -59,6 +61,40 @@ if __name__ == "__main__":
         default="./models/model_3_300.json",
         help="Path to model JSON file",
     )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        default="euclidean",
+        choices=["euclidean", "cosine"],
+        help="Distance between documents and category profiles",
+    )
+    parser.add_argument(
+        "--normalization",
+        type=str,
+        default="support",
+        choices=["support", "document"],
+        help="Normalize documents over each profile's n-grams or all n-grams",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="auto",
+        choices=["auto", "dense", "sparse"],
+        help="Storage of category profiles for scoring",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Number of documents to score per batch",
+    )
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        default=0,
+        help="Number of closest category groups whose categories are scored, "
+        "or flat scoring if 0",
+    )
     parser.add_argument(
         "--logging-level",
         help="Set logging level",
@@ -66,5 +102,6 @@ if __name__ == "__main__":
         default="info",
         type=str,
     )
+    parser.set_defaults(**get_tuned_defaults("predict"))
     LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
     main(parser.parse_args())
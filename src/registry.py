@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from time import perf_counter
+from .classifier import Classifier
+from .train import get_model_name
+import threading
+import logging
+import glob
+import os
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Lazily loaded, memory-bounded LRU of classifiers for all models in a
+    directory, which swaps in retrained model files atomically
+
+    Callers hold on to the classifier returned by `get` for the duration of
+    a classification, so replacing or evicting a model never interrupts
+    in-flight work
+    """
+
+    def __init__(
+        self,
+        models_directory: str,
+        max_bytes: int = 2**30,
+        poll_interval: float = 5.0,
+        **classifier_kwargs
+    ) -> None:
+        self.models_directory = models_directory
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.classifier_kwargs = classifier_kwargs
+
+        # loaded entries as name -> (classifier, size in bytes, file mtime)
+        self.entries: "OrderedDict[str, Tuple[Classifier, int, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks: Dict[str, threading.Lock] = {}
+        # file mtimes of failed reloads as name -> mtime, or None if missing
+        self.failed_mtimes: Dict[str, Optional[float]] = {}
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "reloads": 0,
+            "evictions": 0,
+            "failed_loads": 0,
+            "load_seconds": 0.0,
+            "loaded_bytes": 0,
+        }
+        self.watcher: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def list_models(self) -> List[str]:
+        """List names of all models available on disk"""
+        return sorted(
+            os.path.basename(model_path)[: -len(".json")]
+            for model_path in glob.glob(
+                os.path.join(self.models_directory, "model_*.json")
+            )
+        )
+
+    def get_path(self, name: str) -> str:
+        """Map model name to its file path"""
+        if not name.endswith(".json"):
+            name = "%s.json" % name
+        return os.path.join(self.models_directory, name)
+
+    def load(self, name: str) -> Tuple[Classifier, int, float]:
+        """Load classifier from disk and record load metrics"""
+        model_path = self.get_path(name)
+        mtime = os.path.getmtime(model_path)
+        start = perf_counter()
+        classifier = Classifier.from_path(model_path, **self.classifier_kwargs)
+        size = classifier.get_size()
+        with self.lock:
+            self.metrics["loads"] += 1
+            self.metrics["load_seconds"] += perf_counter() - start
+        LOGGER.info("Loaded model %s (%.1f MB)" % (name, size / 2**20))
+        return classifier, size, mtime
+
+    def insert(self, name: str, entry: Tuple[Classifier, int, float]) -> None:
+        """Insert entry as most recently used"""
+        with self.lock:
+            if name in self.entries:
+                self.metrics["loaded_bytes"] -= self.entries.pop(name)[1]
+            self.entries[name] = entry
+            self.metrics["loaded_bytes"] += entry[1]
+            self.evict()
+
+    def evict(self) -> None:
+        """Evict least recently used entries down to memory budget under lock"""
+        # always keep the newest entry even if it exceeds the budget alone
+        while self.metrics["loaded_bytes"] > self.max_bytes and len(self.entries) > 1:
+            evicted, (_, size, _) = self.entries.popitem(last=False)
+            self.metrics["loaded_bytes"] -= size
+            self.metrics["evictions"] += 1
+            LOGGER.info("Evicted model %s" % evicted)
+
+    def get(self, name: str) -> Classifier:
+        """Get classifier by model name, loading it if required"""
+        name = name[: -len(".json")] if name.endswith(".json") else name
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                self.metrics["hits"] += 1
+                return self.entries[name][0]
+            self.metrics["misses"] += 1
+            load_lock = self.load_locks.setdefault(name, threading.Lock())
+
+        # load each model only once under concurrent misses
+        with load_lock:
+            with self.lock:
+                if name in self.entries:
+                    self.entries.move_to_end(name)
+                    return self.entries[name][0]
+            entry = self.load(name)
+            self.insert(name, entry)
+            return entry[0]
+
+    def get_by_config(self, config: dict) -> Classifier:
+        """Get classifier by model config as stored by `train.main`"""
+        return self.get(get_model_name(config))
+
+    def refresh(self) -> None:
+        """Reload loaded models whose files changed on disk"""
+        with self.lock:
+            loaded = [(name, entry[2]) for name, entry in self.entries.items()]
+
+        for name, mtime in loaded:
+            model_path = self.get_path(name)
+            current: Optional[float]
+            try:
+                current = os.path.getmtime(model_path)
+            except OSError:
+                current = None
+            if current == mtime:
+                continue
+            # retry failed files only once they change again
+            if name in self.failed_mtimes and self.failed_mtimes[name] == current:
+                continue
+            try:
+                entry = self.load(name)
+            except Exception as error:
+                # keep serving the previous model until the file is readable
+                with self.lock:
+                    self.metrics["failed_loads"] += 1
+                self.failed_mtimes[name] = current
+                LOGGER.warning("Failed to reload model %s: %s" % (name, error))
+                continue
+            self.failed_mtimes.pop(name, None)
+
+            # swap entry only if it was not evicted in the meantime
+            with self.lock:
+                if name not in self.entries:
+                    continue
+                self.metrics["reloads"] += 1
+                self.metrics["loaded_bytes"] += entry[1] - self.entries[name][1]
+                self.entries[name] = entry
+                self.evict()
+            LOGGER.info("Reloaded model %s" % name)
+
+    def watch(self) -> None:
+        """Poll models directory for changed files until stopped"""
+        while not self.stop_event.wait(self.poll_interval):
+            self.refresh()
+
+    def start_watching(self) -> None:
+        """Start background thread reloading changed models"""
+        if self.watcher is None:
+            self.stop_event.clear()
+            self.watcher = threading.Thread(target=self.watch, daemon=True)
+            self.watcher.start()
+
+    def stop_watching(self) -> None:
+        """Stop background thread reloading changed models"""
+        if self.watcher is not None:
+            self.stop_event.set()
+            self.watcher.join()
+            self.watcher = None
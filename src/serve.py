@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .utils import ArgparseFormatter, file_path, get_formatted_logger
+from .classifier import Classifier
+from .train import BYTE_TOKENS
+import socketserver
+import argparse
+
+
+class ClassificationHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited documents with their detected categories"""
+
+    def handle(self) -> None:
+        classifier = self.server.classifier  # type: ignore
+        for line in self.rfile:
+            # pass raw bytes through to byte n-gram models
+            doc = line.rstrip(b"\r\n")
+            if classifier.ngram_token not in BYTE_TOKENS:
+                doc = doc.decode("utf8", errors="replace")
+            self.wfile.write(("%s\n" % classifier.predict(doc)).encode("utf8"))
+
+
+class ClassificationServer(socketserver.ThreadingTCPServer):
+    """Threaded TCP server sharing one classifier across connections"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: tuple, classifier: Classifier) -> None:
+        super().__init__(address, ClassificationHandler)
+        self.classifier = classifier
+
+
+def main(args: argparse.Namespace) -> None:
+    """Main workflow to serve category detection over a local socket"""
+    # read model into memory
+    LOGGER.info("Reading model: %s" % args.model)
+    classifier = Classifier.from_path(args.model, backend=args.backend)
+
+    # serve until interrupted
+    with ClassificationServer((args.host, args.port), classifier) as server:
+        LOGGER.info("Serving on %s:%s" % (args.host, args.port))
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(formatter_class=ArgparseFormatter)
+    parser.add_argument(
+        "--model",
+        type=file_path,
+        default="./models/model_3_300.json",
+        help="Path to model JSON file",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to bind to",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to bind to",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="auto",
+        choices=["auto", "dense", "sparse"],
+        help="Storage of category profiles for scoring",
+    )
+    parser.add_argument(
+        "--logging-level",
+        help="Set logging level",
+        choices=["debug", "info", "warning", "error", "critical"],
+        default="info",
+        type=str,
+    )
+    LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
+    main(parser.parse_args())
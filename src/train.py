@@ -2,13 +2,28 @@
 # -*- coding: utf-8 -*-
 
 from tqdm import tqdm
-from typing import List, Tuple, Callable, Any
-from collections import Counter
-from .utils import ArgparseFormatter, dir_path, file_path, get_formatted_logger
+from typing import List, Tuple, Callable, Any, Iterator, Optional
+from itertools import zip_longest, groupby
+from operator import itemgetter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from .utils import (
+    ArgparseFormatter,
+    check_file_paths,
+    dir_path,
+    file_path,
+    get_formatted_logger,
+    get_tuned_defaults,
+)
 from sklearn.datasets import fetch_20newsgroups
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+from scipy.sparse import csr_matrix
+import numpy as np
 import argparse
 import typing
 import json
+import gzip
 import os
 import re
 
@@ -17,6 +32,8 @@ import nltk
 nltk.download("punkt")
 from nltk.tokenize import sent_tokenize, word_tokenize
 
+BYTE_TOKENS = ("byte", "byte_wb")
+
 
 def read_data_from_dataloader(
     loader: Callable[..., Any], **kwargs
@@ -50,6 +67,71 @@ def read_data_from_path(
     return data, labels
 
 
+def iter_data_from_path(data_path: str, labels_path: str) -> Iterator[Tuple[str, str]]:
+    """Lazily read data and label pairs from files"""
+    with open(data_path, "r") as data_stream, open(labels_path, "r") as labels_stream:
+        for doc, label in zip_longest(data_stream, labels_stream):
+            # ensure data sanity
+            assert doc is not None and label is not None
+
+            # yield stripped pair
+            yield doc.strip(), label.strip()
+
+
+def read_document(doc_path: str, binary: bool = False) -> typing.Union[str, bytes]:
+    """Read a plain or gzip-compressed document from disk"""
+    opener: Callable[..., Any] = gzip.open if doc_path.endswith(".gz") else open
+    if binary:
+        with opener(doc_path, "rb") as input_stream:
+            return input_stream.read().strip()
+    with opener(doc_path, "rt", encoding="utf8", errors="replace") as input_stream:
+        return input_stream.read().strip()
+
+
+def iter_paths_from_directory(directory: str) -> Iterator[Tuple[str, str]]:
+    """Walk a corpus tree with one sub-directory per category"""
+    for label in sorted(os.listdir(directory)):
+        category_directory = os.path.join(directory, label)
+        if label.startswith(".") or not os.path.isdir(category_directory):
+            continue
+        for root, directories, files in os.walk(category_directory):
+            directories.sort()
+            for file_name in sorted(files):
+                if not file_name.startswith("."):
+                    yield os.path.join(root, file_name), label
+
+
+def iter_data_from_directory(
+    directory: str, workers: int = 8, prefetch: int = 64, binary: bool = False
+) -> Iterator[Tuple[typing.Union[str, bytes], str]]:
+    """
+    Lazily read data and label pairs from a corpus tree, reading and
+    decompressing up to `prefetch` documents ahead on a bounded thread pool
+    while preserving the walk order
+    """
+    pending: typing.Deque = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for doc_path, label in iter_paths_from_directory(directory):
+                pending.append(
+                    (executor.submit(read_document, doc_path, binary), label)
+                )
+
+                # block on the oldest document once the read-ahead is full
+                if len(pending) >= prefetch:
+                    future, label = pending.popleft()
+                    yield future.result(), label
+
+            # drain remaining documents
+            while pending:
+                future, label = pending.popleft()
+                yield future.result(), label
+        finally:
+            # drop outstanding reads if the consumer stops early
+            for future, _ in pending:
+                future.cancel()
+
+
 def get_indices_by_category(labels: List[str]) -> Tuple[List[str], List[List[int]]]:
     """Compute indices by category"""
     # get unique list of sorted labels
@@ -70,94 +152,102 @@ def get_clean_doc(doc: str) -> str:
     return re.sub(r"\n", " ", re.sub(r"\[[^\[\]]*\]|[^\w\s]|_|\d", "", doc)).lower()
 
 
-def get_ngram_stats(
-    doc: str, ngrams: int, ngram_method: str, ngram_token: str
+def get_byte_ngram_counter(
+    doc: bytes, buffer: np.ndarray, ngrams: int, valid: Optional[np.ndarray] = None
 ) -> typing.Counter:
-    """Gather n-gram statistics per document"""
-
-    # initialize counter
-    counter: typing.Counter = Counter()
-
-    if ngram_method == "normal":
-        # clean doc
-        doc = get_clean_doc(doc)
-        # tokenize document by words
-        words = word_tokenize(doc)
-
-        if ngram_token == "word":
-            # iterate over words
-            for index in range(len(words) - 1):
-                counter += Counter([" ".join(words[index : index + ngrams])])
-
-        elif ngram_token == "char":
-            # iterate over characters in words
-            for word in words:
-                counter += Counter(
-                    [
-                        word[i : i + ngrams]
-                        for i in range(max(1, len(word) - ngrams + 1))
-                    ]
-                )
-
-        elif ngram_token == "char_wb":
-            # pad each word with a space
-            doc = [f" {word} " for word in words]
-
-            # iterate over characters in words
-            for word in doc:
-                counter += Counter(
-                    [
-                        word[i : i + ngrams]
-                        for i in range(max(1, len(word) - ngrams + 1))
-                    ]
-                )
-
-    elif ngram_method == "sentence":
-        if ngram_token == "word":
-            # tokenize document into sentences
-            doc = sent_tokenize(doc)
+    """
+    Count byte n-grams packed into integer keys with a length sentinel, where
+    `buffer` is the unsigned 8-bit view of `doc`
+    """
+    windows = len(buffer) - ngrams + 1
+    if windows <= 0:
+        return Counter()
+    sentinel = 1 << (8 * ngrams)
+
+    if ngrams <= 8:
+        # pack rolling windows into unsigned 64-bit values
+        values = np.zeros(windows, dtype=np.uint64)
+        for offset in range(ngrams):
+            values <<= np.uint64(8)
+            values |= buffer[offset : offset + windows]
+        if valid is not None:
+            values = values[valid]
+        keys, counts = np.unique(values, return_counts=True)
+        return Counter(
+            {
+                sentinel + key: count
+                for key, count in zip(keys.tolist(), counts.tolist())
+            }
+        )
+
+    # fall back to arbitrary precision keys for longer n-grams
+    view = memoryview(doc)
+    return Counter(
+        sentinel + int.from_bytes(view[index : index + ngrams], "big")
+        for index in range(windows)
+        if valid is None or valid[index]
+    )
 
-            # iterate over the characters within sentence structures
-            for sentence in doc:
-                sentence = get_clean_doc(sentence)
-                words = word_tokenize(sentence)
 
-                for index in range(len(words) - ngrams + 1):
-                    counter += Counter([" ".join(words[index : index + ngrams])])
+def get_byte_ngram_stats(
+    doc: typing.Union[str, bytes], ngrams_start: int, ngrams_end: int, ngram_token: str
+) -> typing.Counter:
+    """Gather byte n-gram statistics per UTF-8 document"""
+    if isinstance(doc, str):
+        doc = doc.encode("utf8")
 
-        elif ngram_token == "char_wb":
-            # tokenize into sentences
-            doc = sent_tokenize(doc)
+    # initialize counter
+    counter: typing.Counter = Counter()
+    words = []
 
-            # iterate over the characters within sentence structures
-            for sentence in doc:
-                sentence = get_clean_doc(sentence)
+    if ngram_token == "byte_wb":
+        # pad each word with a space, separating words by two spaces
+        words = doc.split()
+        doc = b" " + b"  ".join(words) + b" " if words else b""
+    buffer = np.frombuffer(doc, dtype=np.uint8)
 
-                words = word_tokenize(sentence)
+    # count word boundaries, i.e. pairs of consecutive spaces, up to each byte
+    spaces = buffer == ord(" ")
+    boundaries = np.concatenate([[0], np.cumsum(spaces[:-1] & spaces[1:])])
 
-                for index, word in enumerate(words):
-                    if index == 0:
-                        word = f"{word} "
-                    elif index == len(words) - 1:
-                        word = f" {word}"
-                    else:
-                        word = f" {word} "
+    # iterate through the range of n-grams
+    for ngrams in range(ngrams_start, ngrams_end + 1):
+        if ngram_token == "byte":
+            counter.update(get_byte_ngram_counter(doc, buffer, ngrams))
+
+        elif ngram_token == "byte_wb":
+            # only keep windows within single padded words
+            windows = max(0, len(buffer) - ngrams + 1)
+            valid = (
+                boundaries[ngrams - 1 : ngrams - 1 + windows] == boundaries[:windows]
+            )
+            counter.update(get_byte_ngram_counter(doc, buffer, ngrams, valid))
 
-                    counter += Counter(
-                        [
-                            word[i : i + ngrams]
-                            for i in range(max(1, len(word) - ngrams + 1))
-                        ]
-                    )
+            # keep padded words shorter than n-grams whole
+            for word in words:
+                if len(word) + 2 < ngrams:
+                    counter[
+                        (1 << (8 * (len(word) + 2)))
+                        + int.from_bytes(b" " + word + b" ", "big")
+                    ] += 1
 
     # return final counter
     return counter
 
 
 def get_ngram_stats(
-    doc: str, ngrams_start: int, ngrams_end: int, ngram_method: str, ngram_token: str
+    doc: typing.Union[str, bytes],
+    ngrams_start: int,
+    ngrams_end: int,
+    ngram_method: str,
+    ngram_token: str,
 ) -> typing.Counter:
     """Gather n-gram statistics per document"""
+    # extract byte n-grams without decoding
+    if ngram_token in BYTE_TOKENS:
+        return get_byte_ngram_stats(doc, ngrams_start, ngrams_end, ngram_token)
+    elif isinstance(doc, bytes):
+        doc = doc.decode("utf8", errors="replace")
 
     # initialize counter
     counter: typing.Counter = Counter()
@@ -187,10 +277,10 @@ def get_ngram_stats(
 
             elif ngram_token == "char_wb":
                 # pad each word with a space
-                doc = [f" {word} " for word in words]
+                padded_words = [f" {word} " for word in words]
 
                 # iterate over characters in words
-                for word in doc:
+                for word in padded_words:
                     counter += Counter(
                         [
                             word[i : i + ngrams]
@@ -251,18 +341,249 @@ def get_normalized_profile(
     return [(element[0], element[1] / total) for element in raw_profile]
 
 
-def main(args: argparse.Namespace) -> None:
-    """Main workflow to compute category profiles"""
-    # read in data and labels to memory
-    LOGGER.info("Reading data")
-    data, labels = read_data_from_dataloader(
-        fetch_20newsgroups, subset="train", remove=("headers", "footers", "quotes")
+def get_selection_scores(
+    counts: np.ndarray,
+    totals: np.ndarray,
+    frequencies: np.ndarray,
+    category_total: float,
+    grand_total: float,
+    num_categories: int,
+    ngram_selection: str,
+) -> np.ndarray:
+    """Score how well n-grams discriminate one category from all others"""
+    # build contingency table of n-gram occurrences inside/outside category
+    a = counts
+    b = totals - counts
+    c = category_total - a
+    d = grand_total - category_total - b
+
+    if ngram_selection == "chi2":
+        numerator = grand_total * np.square(a * d - b * c)
+        denominator = (a + b) * (c + d) * (a + c) * (b + d)
+        scores = np.divide(
+            numerator, denominator, out=np.zeros_like(a), where=denominator > 0
+        )
+        # only keep n-grams positively associated with the category
+        scores[a * d <= b * c] = 0.0
+
+    elif ngram_selection == "idf":
+        # relative in-category frequency weighted by category rarity
+        scores = (a / category_total) * np.log(num_categories / frequencies)
+
+    elif ngram_selection == "information_gain":
+        # mutual information between n-gram occurrence and category
+        scores = np.zeros_like(a)
+        for joint, row, column in (
+            (a, a + b, a + c),
+            (b, a + b, b + d),
+            (c, c + d, a + c),
+            (d, c + d, b + d),
+        ):
+            valid = joint > 0
+            scores[valid] += (joint[valid] / grand_total) * np.log(
+                joint[valid] * grand_total / (row[valid] * column[valid])
+            )
+        # only keep n-grams positively associated with the category
+        scores[a * d <= b * c] = 0.0
+
+    else:
+        raise ValueError("Unknown n-gram selection method: %s" % ngram_selection)
+
+    # never select n-grams absent from the category
+    scores[a == 0] = -np.inf
+    return scores
+
+
+def get_discriminative_profiles(
+    counters: typing.Dict[str, typing.Counter],
+    ngram_cutoff: int,
+    ngram_selection: str,
+    candidate_factor: int,
+) -> typing.Dict[str, List[Tuple[str, int]]]:
+    """Truncate full category counters by cross-category discriminativeness"""
+    # pool the most frequent n-grams of every category as candidates
+    candidates = sorted(
+        {
+            key
+            for counter in counters.values()
+            for key, _ in counter.most_common(ngram_cutoff * candidate_factor)
+        }
     )
-    # data, labels = read_data_from_path(args.train_data, args.train_labels)
 
-    # get unique labels and indices
-    LOGGER.info("Computing category indices")
-    unique_labels, indices_by_category = get_indices_by_category(labels)
+    # gather totals and category frequencies of candidates in a first pass
+    totals = np.zeros(len(candidates))
+    frequencies = np.zeros(len(candidates))
+    for counter in counters.values():
+        counts = np.array([counter.get(key, 0) for key in candidates], dtype=float)
+        totals += counts
+        frequencies += counts > 0
+    category_totals = {
+        label: float(sum(counter.values())) for label, counter in counters.items()
+    }
+    grand_total = sum(category_totals.values())
+
+    # score and truncate candidates per category in a second pass
+    raw_profiles = {}
+    for label, counter in counters.items():
+        counts = np.array([counter.get(key, 0) for key in candidates], dtype=float)
+        scores = get_selection_scores(
+            counts,
+            totals,
+            frequencies,
+            category_totals[label],
+            grand_total,
+            len(counters),
+            ngram_selection,
+        )
+        selected = np.argsort(-scores, kind="stable")[:ngram_cutoff]
+        raw_profiles[label] = [
+            (candidates[index], counter[candidates[index]])
+            for index in selected
+            if np.isfinite(scores[index])
+        ]
+
+    # return truncated raw profiles
+    return raw_profiles
+
+
+def get_profile_clusters(
+    profiles: typing.Dict[str, typing.Dict], num_groups: int
+) -> typing.Dict[str, List[str]]:
+    """Cluster categories by average-linkage cosine distance of their profiles"""
+    labels = list(profiles.keys())
+    if num_groups >= len(labels):
+        return {label: [label] for label in labels}
+
+    # stack profiles as rows over a shared vocabulary
+    vocabulary: typing.Dict[typing.Hashable, int] = {}
+    columns = [
+        vocabulary.setdefault(key, len(vocabulary))
+        for profile in profiles.values()
+        for key in profile
+    ]
+    rows = np.repeat(
+        np.arange(len(labels)), [len(profile) for profile in profiles.values()]
+    )
+    values = [value for profile in profiles.values() for value in profile.values()]
+    matrix = csr_matrix((values, (rows, columns)), shape=(len(labels), len(vocabulary)))
+
+    # compute pairwise cosine distances between profiles
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    similarities = (matrix @ matrix.T).toarray() / np.outer(norms, norms)
+    distances = np.clip(1.0 - similarities, 0.0, None)
+    np.fill_diagonal(distances, 0.0)
+
+    # cut dendrogram into the requested number of groups
+    assignments = fcluster(
+        linkage(squareform(distances, checks=False), method="average"),
+        num_groups,
+        criterion="maxclust",
+    )
+    groups: typing.Dict[str, List[str]] = {}
+    for label, assignment in zip(labels, assignments):
+        groups.setdefault("group_%s" % assignment, []).append(label)
+    return groups
+
+
+def read_hierarchy(
+    hierarchy_path: str, labels: List[str]
+) -> typing.Dict[str, List[str]]:
+    """
+    Read category groups from JSON, keeping unlisted categories on their own
+    in groups named after them, which must not clash with listed groups
+    """
+    with open(hierarchy_path, "r") as input_file_stream:
+        hierarchy = json.load(input_file_stream)
+
+    # keep known categories in their first group only
+    groups: typing.Dict[str, List[str]] = {}
+    grouped: typing.Set[str] = set()
+    for group, members in hierarchy.items():
+        groups[group] = [
+            label for label in members if label in labels and label not in grouped
+        ]
+        grouped.update(groups[group])
+
+    # add singleton groups for unlisted categories
+    for label in labels:
+        if label in grouped:
+            continue
+        if groups.get(label):
+            raise ValueError(
+                "Group %s clashes with the unlisted category of the same name, "
+                "list the category in a group or rename the group" % label
+            )
+        groups[label] = [label]
+    return {group: members for group, members in groups.items() if members}
+
+
+def get_group_profiles(
+    profiles: typing.Dict[str, typing.Dict],
+    groups: typing.Dict[str, List[str]],
+    ngram_cutoff: int,
+) -> typing.Dict[str, typing.Dict]:
+    """Merge member category profiles into truncated group profiles"""
+    group_profiles = {}
+    for group, members in groups.items():
+        merged: typing.Counter = Counter()
+        for label in members:
+            merged.update(profiles[label])
+        group_profiles[group] = dict(
+            get_normalized_profile(merged.most_common(ngram_cutoff))
+        )
+    return group_profiles
+
+
+def get_model_name(config: dict) -> str:
+    """Create model file name from model config"""
+    model_name = "model_%s_to_%s_%s_%s_%s.json" % (
+        config["ngrams_start"],
+        config["ngrams_end"],
+        config["ngram_cutoff"],
+        config["ngram_method"],
+        config["ngram_token"],
+    )
+    ngram_selection = config.get("ngram_selection", "frequency")
+    if ngram_selection != "frequency":
+        model_name = model_name.replace(".json", "_%s.json" % ngram_selection)
+    return model_name
+
+
+def main(args: argparse.Namespace) -> None:
+    """Main workflow to compute category profiles"""
+    if args.train_directory:
+        # stream documents from corpus tree grouped by category
+        LOGGER.info("Streaming data from: %s" % args.train_directory)
+        categories: typing.Iterable[Tuple[str, typing.Iterable[str]]] = (
+            (unique_label, (doc for doc, _ in pairs))
+            for unique_label, pairs in groupby(
+                tqdm(
+                    iter_data_from_directory(
+                        args.train_directory,
+                        args.io_workers,
+                        binary=args.ngram_token in BYTE_TOKENS,
+                    )
+                ),
+                key=itemgetter(1),
+            )
+        )
+    else:
+        # read in data and labels to memory
+        LOGGER.info("Reading data")
+        data, labels = read_data_from_dataloader(
+            fetch_20newsgroups, subset="train", remove=("headers", "footers", "quotes")
+        )
+        # data, labels = read_data_from_path(args.train_data, args.train_labels)
+
+        # get unique labels and indices
+        LOGGER.info("Computing category indices")
+        unique_labels, indices_by_category = get_indices_by_category(labels)
+        categories = tqdm(
+            [
+                (unique_label, [data[index] for index in indices])
+                for unique_label, indices in zip(unique_labels, indices_by_category)
+            ]
+        )
 
     # create model and fill with metadata
     model: dict = {}
@@ -273,65 +594,117 @@ def main(args: argparse.Namespace) -> None:
     model["config"]["ngram_cutoff"] = args.ngram_cutoff
     model["config"]["ngram_method"] = args.ngram_method
     model["config"]["ngram_token"] = args.ngram_token
+    model["config"]["ngram_selection"] = args.ngram_selection
 
     # iterate over all categories and update dictionary
     LOGGER.info("Computing all category profiles")
-    for unique_label, indices in tqdm(list(zip(unique_labels, indices_by_category))):
+    counters: typing.Dict[str, typing.Counter] = {}
+    for unique_label, data_subset in categories:
         # create a local counter per-category
         local_counter: typing.Counter = Counter()
 
-        # get all category-specific data
-        data_subset = [data[index] for index in indices]
-
         # compute n-gram statistics and update counter
         for doc in data_subset:
-            local_counter += get_ngram_stats(
-                doc,
-                args.ngrams_start,
-                args.ngrams_end,
-                args.ngram_method,
-                args.ngram_token,
+            local_counter.update(
+                get_ngram_stats(
+                    doc,
+                    args.ngrams_start,
+                    args.ngrams_end,
+                    args.ngram_method,
+                    args.ngram_token,
+                )
             )
 
-        # truncate counter
-        local_counter = local_counter.most_common(args.ngram_cutoff)
-
-        # normalize output from counter's most_common function
-        local_counter = get_normalized_profile(local_counter)
+        if args.ngram_selection == "frequency":
+            # truncate counter
+            local_counter = local_counter.most_common(args.ngram_cutoff)
+
+            # normalize output from counter's most_common function
+            local_counter = get_normalized_profile(local_counter)
+
+            # add category profile to model
+            model["profiles"][unique_label] = dict(local_counter)
+        else:
+            # keep full counter for cross-category selection
+            counters[unique_label] = local_counter
+
+    # truncate profiles by discriminativeness if required
+    if args.ngram_selection != "frequency":
+        LOGGER.info("Selecting n-grams by %s" % args.ngram_selection)
+        raw_profiles = get_discriminative_profiles(
+            counters,
+            args.ngram_cutoff,
+            args.ngram_selection,
+            args.ngram_candidate_factor,
+        )
+        for unique_label in counters:
+            model["profiles"][unique_label] = dict(
+                get_normalized_profile(raw_profiles[unique_label])
+            )
 
-        # add category profile to model
-        model["profiles"][unique_label] = dict(local_counter)
+    # merge category profiles into group profiles for coarse-to-fine scoring
+    if args.hierarchy_file or args.hierarchy_groups:
+        if args.hierarchy_file:
+            LOGGER.info("Reading category hierarchy: %s" % args.hierarchy_file)
+            groups = read_hierarchy(args.hierarchy_file, list(model["profiles"]))
+        else:
+            LOGGER.info("Clustering categories into %s groups" % args.hierarchy_groups)
+            groups = get_profile_clusters(model["profiles"], args.hierarchy_groups)
+        model["hierarchy"] = {
+            "groups": groups,
+            "profiles": get_group_profiles(
+                model["profiles"], groups, args.ngram_cutoff
+            ),
+        }
 
     # create model and and path
-    model_name = "model_%s_to_%s_%s_%s_%s.json" % (
-        args.ngrams_start,
-        args.ngrams_end,
-        args.ngram_cutoff,
-        args.ngram_method,
-        args.ngram_token,
-    )
+    model_name = get_model_name(model["config"])
     model_path = os.path.join(args.models_directory, model_name)
 
+    # report final model size
+    LOGGER.info(
+        "Model size: %s profile entries over %s unique n-grams"
+        % (
+            sum(len(profile) for profile in model["profiles"].values()),
+            len({key for profile in model["profiles"].values() for key in profile}),
+        )
+    )
+
     # dump final model
     LOGGER.info("Dumping final model: %s" % model_path)
-    with open(model_path, "w", encoding="utf8") as output_file_stream:
+    with open("%s.tmp" % model_path, "w", encoding="utf8") as output_file_stream:
         json.dump(model, output_file_stream, ensure_ascii=False)
 
+    # replace any previous model atomically for running registries
+    os.replace("%s.tmp" % model_path, model_path)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(formatter_class=ArgparseFormatter)
     parser.add_argument(
         "--train-data",
-        type=file_path,
+        type=str,
         default="./data/wili-2018/x_train.txt",
         help="Path to training data",
     )
     parser.add_argument(
         "--train-labels",
-        type=file_path,
+        type=str,
         default="./data/wili-2018/y_train.txt",
         help="Path to training labels",
     )
+    parser.add_argument(
+        "--train-directory",
+        type=dir_path,
+        help="Path to training corpus tree with one sub-directory per category, "
+        "used instead of training data and labels if provided",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=8,
+        help="Number of threads reading documents from the corpus tree",
+    )
     parser.add_argument(
         "--models-directory",
         type=dir_path,
@@ -367,9 +740,36 @@ if __name__ == "__main__":
         "--ngram-token",
         type=str,
         default="char_wb",
-        choices=["word", "char", "char_wb"],
+        choices=["word", "char", "char_wb", "byte", "byte_wb"],
         help="Define the token considered to build n-gram profile",
     )
+    parser.add_argument(
+        "--ngram-selection",
+        type=str,
+        default="frequency",
+        choices=["frequency", "chi2", "idf", "information_gain"],
+        help="Define how n-grams are ranked before applying the cutoff",
+    )
+    parser.add_argument(
+        "--ngram-candidate-factor",
+        type=int,
+        default=5,
+        help="Multiple of the cutoff of most frequent n-grams per category "
+        "considered for discriminative selection",
+    )
+    parser.add_argument(
+        "--hierarchy-groups",
+        type=int,
+        default=0,
+        help="Number of groups to cluster category profiles into for "
+        "coarse-to-fine classification, or none if 0",
+    )
+    parser.add_argument(
+        "--hierarchy-file",
+        type=file_path,
+        help="Path to JSON file mapping group names to category lists, "
+        "used instead of clustering if provided",
+    )
     parser.add_argument(
         "--logging-level",
         help="Set logging level",
@@ -377,5 +777,9 @@ if __name__ == "__main__":
         default="info",
         type=str,
     )
+    parser.set_defaults(**get_tuned_defaults("train"))
     LOGGER = get_formatted_logger(parser.parse_known_args()[0].logging_level)
-    main(parser.parse_args())
+    args = parser.parse_args()
+    if not args.train_directory:
+        check_file_paths(parser, args, "train_data", "train_labels")
+    main(args)
@@ -1,15 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Iterable, Optional
+from typing import Any, Dict, Iterable, Optional
 from operator import attrgetter
 import argparse
 import logging
+import json
 import os
 import re
 
 FORMAT = (
     '%(asctime)s | %(levelname)s | %(filename)s | %(funcName)s | %(message)s')
+TUNED_CONFIG = './models/autotune.json'
 
 
 def dir_path(path: str) -> str:
@@ -28,6 +30,25 @@ def file_path(path: str) -> str:
         raise argparse.ArgumentTypeError("%s is not a valid file" % path)
 
 
+def check_file_paths(parser: argparse.ArgumentParser, args: argparse.Namespace,
+                     *names: str) -> None:
+    """ Validate file arguments only once they are known to be used """
+    for name in names:
+        try:
+            file_path(getattr(args, name))
+        except argparse.ArgumentTypeError as error:
+            parser.error('argument --%s: %s' % (name.replace('_', '-'), error))
+
+
+def get_tuned_defaults(workflow: str,
+                       config_path: str = TUNED_CONFIG) -> Dict[str, Any]:
+    """ Read argument defaults tuned for this host if available """
+    if os.path.isfile(config_path):
+        with open(config_path, 'r') as input_file_stream:
+            return json.load(input_file_stream).get(workflow, {})
+    return {}
+
+
 def get_formatted_logger(level: str) -> logging.Logger:
     """ Create a sane logger """
     # get root logger